@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Benchmark suite for the image converter. Runs the conversion steps on deterministic synthetic terrain, so that no GIS data nor display is needed.
+# Results are written in a JSON file, and can be compared against a saved baseline:
+#	./benchmark.py --sizes 1024 2048 --output new.json --baseline old.json --threshold 1.2
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import numpy as np
+
+import database
+import rivers
+from landcover import make_landcover
+
+legend_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Land cover tables", "clc.lct")
+
+def fractal_noise(size, rng, persistence=0.5, block=1024): # Sum of bilinearly interpolated random grids, with doubling frequency
+	noise = np.zeros((size, size), dtype=np.float32)
+	octaves = max(int(np.log2(size)) - 2, 1) # Finest grid has 4 px cells
+	amplitude = 1.
+	for k in range(1, octaves+1):
+		cells = 2**k
+		grid = rng.standard_normal((cells+1, cells+1)).astype(np.float32)
+		pos = np.arange(size) * (cells / size)
+		i = pos.astype(int)
+		w = (pos - i).astype(np.float32)
+		gx = grid[:,i] * (1-w) + grid[:,i+1] * w # Interpolate along X for every row of the grid
+		for y in range(0, size, block): # Then along Y, by blocks to limit memory usage
+			iy = i[y:y+block]
+			wy = w[y:y+block,None]
+			noise[y:y+block,:] += amplitude * (gx[iy,:] * (1-wy) + gx[iy+1,:] * wy)
+		amplitude *= persistence
+	return noise
+
+def make_terrain(size, seed=0, sea_fraction=0.3, relief=3000):
+	rng = np.random.RandomState(seed)
+	noise = fractal_noise(size, rng)
+	sample = noise[::8,::8]
+	sea = np.percentile(sample, sea_fraction*100)
+	top = sample.max()
+	heightmap = ((noise - sea) * (relief / (top - sea))).astype(np.int16) # Sea level at 0 m, highest point at 'relief'
+
+	cover = fractal_noise(size, rng) # Fake Corine Land Cover raster, with values 1-37 on land and 44 (sea) elsewhere
+	bins = np.percentile(cover[::8,::8], np.linspace(0, 100, 38)[1:-1])
+	landcover = (np.digitize(cover, bins) + 1).astype(np.uint8)
+	landcover[heightmap <= 0] = 44
+	return heightmap, landcover
+
+def timeit(func, repeat=1):
+	best = None
+	for r in range(repeat):
+		t0 = time.perf_counter()
+		result = func()
+		t = time.perf_counter() - t0
+		if best is None or t < best:
+			best = t
+	return best, result
+
+def generate_database(heightmap, rivermap, landmap, legend, tmpdir, frag):
+	fpath_output = os.path.join(tmpdir, "heightmap.dat")
+	database.generate(open(fpath_output, "wb"), open(fpath_output + ".conf", "w"), heightmap.copy(), rivermap=rivermap, landmap=landmap, landmap_legend=legend, frag=frag) # generate modifies heightmap in place
+	return fpath_output
+
+def decode_random(fpath, n, seed=0):
+	with open(fpath, "rb") as f:
+		reader = database.Reader(f)
+		rng = np.random.RandomState(seed)
+		nchunks = reader.chunks_x * reader.chunks_y
+		for datatype in reader.layers:
+			for chunk in rng.randint(nchunks, size=n):
+				reader.get_chunk(datatype, int(chunk))
+
+def check_query(fpath, seed=0): # Compare queries on pixel boundaries and inside pixels with the formulas of the mod
+	with open(fpath, "rb") as f:
+		reader = database.Reader(f)
+		rng = np.random.RandomState(seed)
+		xint = np.concatenate(([0, reader.X-1, 0, reader.X-1], rng.randint(reader.X, size=1000))) # Corners and pixel boundaries
+		yint = np.concatenate(([0, 0, reader.Y-1, reader.Y-1], rng.randint(reader.Y, size=1000)))
+		xdb = np.concatenate((xint, xint + .5, rng.uniform(0, reader.X, 1000))) # Then pixel centers and random points
+		ydb = np.concatenate((yint, yint + .5, rng.uniform(0, reader.Y, 1000)))
+		expected = reader.get_values(0, np.floor(xdb), np.floor(ydb))
+		for scale in (1, 0.5, 0.25): # Full map and previews
+			conf = database.read_conf(None)
+			conf.update(scale_x=scale, scale_z=scale, offset_x=-100, offset_z=100)
+			result = reader.query(xdb, ydb, conf)
+			x, z, valid = result["x"], result["z"], result["valid"]
+			xmap = np.floor((x - conf["offset_x"]) * scale)
+			zmap = np.floor((z - conf["offset_z"]) * scale)
+			# Range of nodes generated by the mod (see init.lua)
+			generated = (x >= np.ceil(conf["offset_x"])) & (x <= np.floor(reader.X/scale + conf["offset_x"])) & (z >= np.ceil(-reader.Y/scale + conf["offset_z"])) & (z <= np.floor(conf["offset_z"]))
+			assert (valid == generated).all(), "Validity doesn't match the nodes generated by the mod"
+			assert valid[ydb >= 1].all(), "Points below the first row are invalid" # With previews, the first row may fall outside the generated nodes
+			assert (xmap[valid] == np.floor(xdb[valid])).all() and (-zmap[valid] == np.floor(ydb[valid])).all(), "Nodes don't match queried pixels"
+			assert (result["height"][valid] == expected[valid]).all(), "Heights don't match the database"
+
+def query_random(fpath, n, seed=0):
+	with open(fpath, "rb") as f:
+		reader = database.Reader(f)
+		rng = np.random.RandomState(seed)
+		reader.query(rng.uniform(0, reader.X, n), rng.uniform(0, reader.Y, n))
+
+def run(sizes, repeat=1, river_max_size=4096, frag=80, n_decode=1000, n_query=100000, seed=0):
+	results = {}
+	def record(name, size, t):
+		results["{:s}@{:d}".format(name, size)] = t
+		print("[benchmark]", name, size, "{:.3f} s".format(t))
+
+	with tempfile.TemporaryDirectory() as tmpdir:
+		for size in sizes:
+			print("[benchmark] Generating synthetic terrain", size, "x", size)
+			heightmap, landcover = make_terrain(size, seed=seed)
+
+			rivermap = None
+			if size <= river_max_size:
+				np.random.seed(seed) # generate_rivermap uses random numbers to break ties
+				t, rivermap = timeit(lambda: rivers.generate_rivermap(heightmap, sea_level=0), repeat)
+				record("generate_rivermap", size, t)
+
+			t, (landmap, legend) = timeit(lambda: make_landcover(landcover, legend_path), repeat)
+			record("make_landcover", size, t)
+
+			t, _ = timeit(lambda: database.layer(io.BytesIO(), heightmap // 40, 0, frag), repeat)
+			record("layer", size, t)
+
+			def full_generate():
+				if size <= river_max_size:
+					np.random.seed(seed)
+					rmap = rivers.generate_rivermap(heightmap, sea_level=0)
+				else:
+					rmap = None
+				lmap, lgd = make_landcover(landcover, legend_path)
+				return generate_database(heightmap, rmap, lmap, lgd, tmpdir, frag)
+			t, fpath = timeit(full_generate, repeat)
+			record("generate", size, t)
+
+			t, _ = timeit(lambda: decode_random(fpath, n_decode, seed=seed), repeat)
+			record("decode_random", size, t)
+
+			check_query(fpath, seed=seed)
+			t, _ = timeit(lambda: query_random(fpath, n_query, seed=seed), repeat)
+			record("query", size, t)
+
+	return results
+
+def compare(results, baseline, threshold, min_delta):
+	regressions = []
+	for name, t in sorted(results.items()):
+		if name not in baseline:
+			print("[benchmark]", name, "not in baseline")
+			continue
+		ratio = t / baseline[name]
+		status = "ok"
+		if ratio > threshold and t - baseline[name] > min_delta: # Short measures are too noisy for the ratio alone
+			status = "REGRESSION"
+			regressions.append(name)
+		print("[benchmark] {:s}: {:.3f} s (baseline {:.3f} s, x{:.2f}) {:s}".format(name, t, baseline[name], ratio, status))
+	for name in sorted(baseline):
+		if name not in results: # A crashed or partial run must not pass
+			print("[benchmark] {:s}: missing from results MISSING".format(name))
+			regressions.append(name)
+	return regressions
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the image converter on synthetic terrain")
+	parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 2048, 4096, 8192, 16384], help="Map sizes in px (square maps)")
+	parser.add_argument("--repeat", type=int, default=3, help="Number of runs per measure, the fastest one is kept")
+	parser.add_argument("--river-max-size", type=int, default=4096, help="Skip rivers calculation above this size, since it is very slow")
+	parser.add_argument("--frag", type=int, default=80, help="Tiles size")
+	parser.add_argument("--decode", type=int, default=1000, help="Number of random tiles to decode per layer")
+	parser.add_argument("--query", type=int, default=100000, help="Number of random points for batch queries")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--output", default="benchmark.json", help="Output file for results")
+	parser.add_argument("--baseline", help="Results file to compare against")
+	parser.add_argument("--threshold", type=float, default=1.2, help="Maximal allowed ratio between new and baseline times")
+	parser.add_argument("--min-delta", type=float, default=0.05, help="Minimal time difference in seconds to report a regression")
+	args = parser.parse_args()
+
+	results = {}
+	errors = []
+	def target():
+		try:
+			results.update(run(args.sizes, repeat=args.repeat, river_max_size=args.river_max_size, frag=args.frag, n_decode=args.decode, n_query=args.query, seed=args.seed))
+		except Exception:
+			traceback.print_exc()
+			errors.append(traceback.format_exc())
+	# Rivers calculation is recursive, and the recursion limit set by the rivers module needs a larger stack than the default one
+	threading.stack_size(512*1024*1024)
+	thread = threading.Thread(target=target)
+	thread.start()
+	thread.join()
+
+	output = {
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"machine": platform.machine(),
+		"results": results,
+	}
+	if errors:
+		output["error"] = errors[0]
+	with open(args.output, "w") as f:
+		json.dump(output, f, indent="\t", sort_keys=True)
+	print("[benchmark] Results written in", args.output)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)["results"]
+		regressions = compare(results, baseline, args.threshold, args.min_delta)
+		if regressions:
+			print("[benchmark]", len(regressions), "regression(s) above threshold x{:.2f} or missing measure(s)".format(args.threshold))
+			sys.exit(1)
+
+	if errors:
+		print("[benchmark] Benchmark failed, results are incomplete")
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
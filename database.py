@@ -36,7 +36,9 @@ def le(n):
 
 layer_count = 0
 
-def layer(data, datamap, datatype, frag, meta=b""): # Add a layer
+layer_names = {0: "heightmap", 1: "rivermap", 2: "landcover"}
+
+def layer(data, datamap, datatype, frag, meta=b"", progress=None): # Add a layer
 	dmin = int(np.floor(datamap.min()))
 	dmax = int(np.floor(datamap.max()))
 	signed = dmin < 0
@@ -63,6 +65,8 @@ def layer(data, datamap, datatype, frag, meta=b""): # Add a layer
 	layer_data = io.BytesIO()
 	i = 0
 	n = 0
+	if progress:
+		progress("Adding " + layer_names[datatype], 0)
 	for y in range(0, Y, frag):
 		for x in range(0, X, frag):
 			part = datamap[y:y+frag,x:x+frag] # Take only the chunk x;y
@@ -70,6 +74,8 @@ def layer(data, datamap, datatype, frag, meta=b""): # Add a layer
 			n += layer_data.write(zlib.compress(part_raw, 9)) # Add this to the binary buffer, and increment n by the number of bytes
 			layer_table[i] = n # Sets the position of the end of the chunk
 			i += 1
+		if progress: # Once per row of chunks
+			progress("Adding " + layer_names[datatype], min(y + frag, Y) / Y)
 
 	layer_table_raw = zlib.compress(layer_table.tobytes(), 9) # Compress the table too
 	table_length = len(layer_table_raw)
@@ -84,10 +90,12 @@ def layer(data, datamap, datatype, frag, meta=b""): # Add a layer
 	global layer_count
 	layer_count += 1
 
-def generate(file_output, file_conf, heightmap, rivermap=None, landmap=None, landmap_legend=None, frag=80, scale=40):
-	global table_size
+def generate(file_output, file_conf, heightmap, rivermap=None, landmap=None, landmap_legend=None, frag=80, scale=40, scale_x=1, scale_z=1, progress=None):
+	global table_size, layer_count
 	print("Generating database")
 
+	layer_count = 0 # Reset, in case a database has already been generated in this session
+
 	(Y, X) = heightmap.shape
 
 	data = io.BytesIO() # This allows faster concatenation
@@ -95,15 +103,15 @@ def generate(file_output, file_conf, heightmap, rivermap=None, landmap=None, lan
 	heightmap //= scale
 
 	print("Adding heightmap")
-	layer(data, heightmap, 0, frag)
+	layer(data, heightmap, 0, frag, progress=progress)
 
 	if type(rivermap) is not type(None):
 		print("Adding rivermap")
-		layer(data, rivermap, 1, frag)
+		layer(data, rivermap, 1, frag, progress=progress)
 
 	if type(landmap) is not type(None):
 		print("Adding landcover")
-		layer(data, landmap, 2, frag, meta=landmap_legend)
+		layer(data, landmap, 2, frag, meta=landmap_legend, progress=progress)
 
 	print("Writing file")
 	# Build file header
@@ -113,7 +121,115 @@ def generate(file_output, file_conf, heightmap, rivermap=None, landmap=None, lan
 	file_output.write(header + data.getbuffer())
 	file_output.close()
 
-	file_conf.write("scale_y = 1")
+	file_conf.write("scale_y = 1\n")
+	if scale_x != 1 or scale_z != 1: # Preview: map is smaller than its footprint in nodes
+		file_conf.write("scale_x = {}\nscale_z = {}\n".format(scale_x, scale_z))
 	file_conf.close()
 
 	print("Done.")
+
+class Reader: # Random access to a database, decoding chunks like the mod does
+	def __init__(self, file_input):
+		if file_input.read(5) != b'GEOMG':
+			print("WARNING: file may not be in the appropriate format. Signature \"GEOMG\" not recognized.")
+		self.version = np.frombuffer(file_input.read(1), dtype="<u1")[0]
+		self.frag, self.X, self.Y = (int(n) for n in np.frombuffer(file_input.read(6), dtype="<u2"))
+		self.chunks_x, self.chunks_y = int(np.ceil(self.X / self.frag)), int(np.ceil(self.Y / self.frag))
+		self.file = file_input
+
+		self.layers = {} # Indexed by data type: 0 = heightmap, 1 = rivermap, 2 = landcover
+		layer_count = np.frombuffer(file_input.read(1), dtype="<u1")[0]
+		for l in range(layer_count):
+			datatype, itemsize_raw = np.frombuffer(file_input.read(2), dtype="<u1")
+			table_length = int(np.frombuffer(file_input.read(4), dtype="<u4")[0])
+			meta = b""
+			if self.version >= 1:
+				meta_length = int(np.frombuffer(file_input.read(2), dtype="<u2")[0])
+				meta = file_input.read(meta_length)
+			table = np.frombuffer(zlib.decompress(file_input.read(table_length)), dtype="<u4")
+			signed = itemsize_raw >= 16
+			itemsize = itemsize_raw - 16*signed
+			self.layers[int(datatype)] = {
+				"dtype": np.dtype("<" + ("i" if signed else "u") + str(itemsize)),
+				"table": np.concatenate(([0], table)), # Chunk n goes from table[n] (inclusive) to table[n+1] (exclusive)
+				"offset": file_input.tell(),
+				"meta": meta,
+			}
+			file_input.seek(int(table[-1]), io.SEEK_CUR) # Skip data and go to the next layer
+
+	def get_chunk(self, datatype, n): # Decode chunk n (starting at 0) as a 2D array
+		layer = self.layers[datatype]
+		table = layer["table"]
+		self.file.seek(layer["offset"] + int(table[n]))
+		data_raw = zlib.decompress(self.file.read(int(table[n+1] - table[n])))
+		cy, cx = divmod(n, self.chunks_x)
+		width = min(self.frag, self.X - cx*self.frag) # Last chunks of a row or column may be truncated
+		return np.frombuffer(data_raw, dtype=layer["dtype"]).reshape(-1, width)
+
+	def get_values(self, datatype, xmap, ymap): # Values at arrays of pixel coordinates, decoding every chunk only once
+		xmap, ymap = np.asarray(xmap, dtype=int), np.asarray(ymap, dtype=int)
+		values = np.zeros(xmap.shape, dtype=self.layers[datatype]["dtype"])
+		cx, px = np.divmod(xmap.ravel(), self.frag)
+		cy, py = np.divmod(ymap.ravel(), self.frag)
+		nchunks = cx + cy * self.chunks_x
+		order = np.argsort(nchunks, kind="stable") # Group points by chunk
+		chunks, starts = np.unique(nchunks[order], return_index=True)
+		flat_values = values.reshape(-1)
+		for n, points in zip(chunks, np.split(order, starts[1:])):
+			chunk = self.get_chunk(datatype, int(n))
+			flat_values[points] = chunk[py[points], px[points]]
+		return values
+
+	def query(self, xdb, ydb, conf=None): # Query arrays of positions in pixels of the database: give node coordinates and values as generated by the mod
+		if conf == None:
+			conf = read_conf(None)
+		scale_x, scale_y, scale_z = conf["scale_x"], conf["scale_y"], conf["scale_z"]
+		offset_x, offset_y, offset_z = conf["offset_x"], conf["offset_y"], conf["offset_z"]
+
+		# Node containing each point, then the pixel actually read by the mod for this node (see init.lua)
+		x = np.floor(np.asarray(xdb) / scale_x + offset_x).astype(int)
+		z = (np.ceil((1 - np.asarray(ydb)) / scale_z + offset_z) - 1).astype(int) # Row r covers z in [offset_z - r/scale_z, offset_z + (1-r)/scale_z)
+		xmap = np.floor((x - offset_x) * scale_x).astype(int)
+		ymap = -np.floor((z - offset_z) * scale_z).astype(int)
+		valid = (xmap >= 0) & (xmap < self.X) & (ymap >= 0) & (ymap < self.Y)
+		# Nodes actually generated by the mod
+		xmin, xmax = np.ceil(offset_x), np.floor(self.X/scale_x + offset_x)
+		zmin, zmax = np.ceil(-self.Y/scale_z + offset_z), np.floor(offset_z)
+		valid &= (x >= xmin) & (x <= xmax) & (z >= zmin) & (z <= zmax)
+
+		result = {"x": x, "z": z, "valid": valid}
+		xv, yv = xmap[valid], ymap[valid]
+		if 0 in self.layers:
+			height = np.zeros(x.shape, dtype=int)
+			height[valid] = np.floor(self.get_values(0, xv, yv) / scale_y + offset_y)
+			result["height"] = height
+		if 1 in self.layers:
+			river = np.zeros(x.shape, dtype=bool)
+			river[valid] = self.get_values(1, xv, yv) > 0
+			result["river"] = river
+		if 2 in self.layers:
+			landcover = np.zeros(x.shape, dtype=int) # 0 means no land cover, else index in the legend (starting at 1)
+			landcover[valid] = self.get_values(2, xv, yv)
+			result["landcover"] = landcover
+		return result
+
+def read_conf(fpath_conf): # Read the settings of heightmap.dat.conf used for geometry, with the same defaults as the mod
+	settings = {}
+	if fpath_conf:
+		with open(fpath_conf) as f:
+			for line in f:
+				if "=" in line and not line.lstrip().startswith("#"):
+					name, value = line.split("=", 1)
+					settings[name.strip()] = value.strip()
+
+	def get(name, default):
+		return float(settings.get(name, default))
+
+	return {
+		"scale_x": get("scale_x", 1),
+		"scale_y": get("scale_y", settings.get("scale", 1)),
+		"scale_z": get("scale_z", 1),
+		"offset_x": get("offset_x", 0),
+		"offset_y": get("offset_y", 0),
+		"offset_z": get("offset_z", 0),
+	}
@@ -1,13 +1,17 @@
+import numpy as np
+
+# Both functions work on scalars as well as on numpy arrays of coordinates
+
 def transform(gt, pos):
 	a,b,c,d,e,f = gt
-	px, py = pos[0], pos[1]
+	px, py = np.asarray(pos[0]), np.asarray(pos[1])
 	x = a + b*px + c*py
 	y = d + e*px + f*py
 	return x, y
 
 def inverse(gt, pos):
 	a,b,c,d,e,f = gt
-	x, y = pos[0], pos[1]
+	x, y = np.asarray(pos[0]), np.asarray(pos[1])
 	if c == 0:
 		px = (x-a) / b
 		py = (y-d-e*px) / f
@@ -5,11 +5,16 @@
 import tkinter as tk
 import tkinter.filedialog as fd
 import tkinter.simpledialog as sd
+import tkinter.ttk as ttk
 import functools
+import os
+import threading
+import traceback
 
 import map_transform
 import database
 import rivers
+import progress
 from landcover import make_landcover
 
 root = tk.Tk()
@@ -141,10 +146,10 @@ fullsize_button.grid(row=0, column=1, rowspan=3, columnspan=3, sticky="S")
 
 region_gui_update()
 
-def update_parameters():
+def get_parameters():
 	value = region_rb_var.get()
 	if value == 0:
-		map_transform.set_parameters(reproject=False, crop=False, reference="heightmap")
+		return {"reproject": False, "crop": False, "reference": "heightmap"}
 	if value >= 1:
 		if value == 2:
 			reproject=True
@@ -152,12 +157,14 @@ def update_parameters():
 			reproject=False
 
 		north, east, south, west, hscale = north_entry.get(), east_entry.get(), south_entry.get(), west_entry.get(), hscale_entry.get()
-		map_transform.set_parameters(reproject=reproject, crop=True, region=(north, east, south, west), hscale=hscale)
+		return {"reproject": reproject, "crop": True, "region": (north, east, south, west), "hscale": hscale}
 
-def map_size_update(*args):
-	update_parameters()
+def update_parameters():
+	map_transform.set_parameters(**get_parameters())
 
-	npx, npy, _, _, _ = map_transform.get_map_size()
+def map_size_update(*args):
+	# Don't change map_transform parameters, they may be in use by a running conversion
+	npx, npy, _, _, _ = map_transform.get_map_size(**get_parameters())
 	map_size_label.config(text="{:d} x {:d}".format(int(npx), int(npy)))
 
 calc_button = tk.Button(frame_region, text="Calculate size", command=map_size_update)
@@ -167,6 +174,21 @@ calc_button.grid(row=6, column=2)
 tile_size_entry = NumberEntry(frame_params, 0, 1024, row=0, column=0, text="Tiles size", default=80)
 scale_entry = NumberEntry(frame_params, 0, 1000, row=1, column=0, text="Vertical scale in meters per node", default=40)
 
+def preview_gui_update(*args):
+	if preview_cb_var.get():
+		preview_size_entry.set_state("normal")
+	else:
+		preview_size_entry.set_state("disabled")
+
+preview_cb_var = tk.BooleanVar()
+preview_cb_var.set(False)
+preview_cb_var.trace("w", preview_gui_update)
+preview_cb = tk.Checkbutton(frame_params, text="Fast preview", variable=preview_cb_var)
+preview_cb.grid(row=2, column=0, sticky="W")
+preview_size_entry = NumberEntry(frame_params, 16, 16384, incr=256, row=3, column=0, text="Preview size", default=1024)
+
+preview_gui_update()
+
 def landcover_gui_update(*args):
 	if landcover_cb_var.get():
 		st = "normal"
@@ -237,7 +259,31 @@ sea_level_entry = NumberEntry(frame_rivers, -32768, 65535, row=5, column=1, text
 
 river_gui_update()
 
+frame_progress = tk.Frame(root)
+frame_progress.pack()
+progress_bar = ttk.Progressbar(frame_progress, length=400, maximum=1.)
+progress_bar.grid(row=0, column=0)
+progress_label = tk.Label(frame_progress, text="", width=60)
+progress_label.grid(row=1, column=0, columnspan=2)
+
+conversion = None # Progress object of the running conversion, if any
+
+def set_inputs_state(state): # Lock the maps and region during a conversion, since map_transform is used by the worker
+	for entry in (input_entry, landcover_input_entry, river_input_entry, north_entry, east_entry, south_entry, west_entry, hscale_entry):
+		entry.set_state(state)
+	# Also lock the options whose traces would enable the entries again
+	for widget in (region_rb1, region_rb2, region_rb3, fullsize_button, landcover_cb, river_cb, rivermode_rb1, rivermode_rb2):
+		widget.config(state=state)
+	if state == "normal": # Restore the states depending on options
+		region_gui_update()
+		landcover_gui_update()
+		river_gui_update()
+
 def proceed():
+	global conversion
+	if conversion:
+		return
+
 	fpath_output = output_entry.get()
 	fpath_output += "/heightmap.dat"
 	fpath_conf = fpath_output + ".conf"
@@ -246,34 +292,111 @@ def proceed():
 	file_conf = open(fpath_conf, "w")
 
 	update_parameters()
-	
-	heightmap = map_transform.read_map("heightmap", interp=4) # Read with Lanczos interpolation (code 4)
-	if river_cb_var.get():
-		rivers_from_file = rivermode_rb_var.get() == 1
-		if rivers_from_file:
-			rivermap = map_transform.read_map("rivers", interp=8)
-		else:
-			river_limit = river_limit_entry.get()
-			river_power = river_power_entry.get()
-			sea_level = sea_level_entry.get()
-			max_river_hdiff = river_hdiff_entry.get()
-			rivermap = rivers.generate_rivermap(heightmap, sea_level=sea_level, river_limit=river_limit, river_power=river_power)
-	else:
-		rivermap = None
-
-	if landcover_cb_var.get():
-		fpath_legend = landcover_legend_entry.get()
-		landmap_raw = map_transform.read_map("landcover", interp=0)
-		landmap, legend = make_landcover(landmap_raw, fpath_legend)
-	else:
-		landmap = None
-		legend = None
 
+	# Read every parameter here: Tk variables must not be used from the worker thread
+	enable_rivers = river_cb_var.get()
+	rivers_from_file = rivermode_rb_var.get() == 1
+	river_limit = river_limit_entry.get()
+	river_power = river_power_entry.get()
+	sea_level = sea_level_entry.get()
+	max_river_hdiff = river_hdiff_entry.get()
+	enable_landcover = landcover_cb_var.get()
+	fpath_legend = landcover_legend_entry.get()
 	tile_size = tile_size_entry.get()
-	scale = scale_entry.get()	
-	database.generate(file_output, file_conf, heightmap, rivermap=rivermap, landmap=landmap, landmap_legend=legend, frag=tile_size, scale=scale)
-
-proceed_button = tk.Button(root, text="Proceed", command = proceed)
+	scale = scale_entry.get()
+	preview = None
+	if preview_cb_var.get():
+		preview = preview_size_entry.get()
+
+	task = progress.Progress()
+	conversion = task
+
+	def convert(): # Runs in a separate thread
+		try:
+			task("Reading heightmap", 0)
+			heightmap = map_transform.read_map("heightmap", interp=4, progress=task, preview=preview) # Read with Lanczos interpolation (code 4)
+			scale_x, scale_z = 1, 1
+			if preview: # Stretch the preview to the size of the full map
+				npx, npy, _, _, _ = map_transform.get_map_size()
+				scale_x, scale_z = heightmap.shape[1] / npx, heightmap.shape[0] / npy
+			if enable_rivers:
+				if rivers_from_file:
+					rivermap = map_transform.read_map("rivers", interp=8, progress=task, preview=preview)
+				else:
+					# A preview pixel covers 1/(scale_x*scale_z) nodes, so the drainage basin is smaller in pixels
+					rivermap = rivers.generate_rivermap(heightmap, sea_level=sea_level, river_limit=max(river_limit * scale_x * scale_z, 1), river_power=river_power, progress=task)
+			else:
+				rivermap = None
+
+			if enable_landcover:
+				landmap_raw = map_transform.read_map("landcover", interp=0, progress=task, preview=preview)
+				task("Making land cover", 0)
+				landmap, legend = make_landcover(landmap_raw, fpath_legend)
+			else:
+				landmap = None
+				legend = None
+
+			database.generate(file_output, file_conf, heightmap, rivermap=rivermap, landmap=landmap, landmap_legend=legend, frag=tile_size, scale=scale, scale_x=scale_x, scale_z=scale_z, progress=task)
+			task.finish("done")
+		except Exception as e:
+			file_output.close()
+			file_conf.close()
+			os.remove(fpath_output) # Don't leave a partial database in the world
+			os.remove(fpath_conf)
+			if isinstance(e, progress.Cancelled):
+				print("Cancelled.")
+				task.finish("cancelled")
+			else:
+				traceback.print_exc()
+				task.finish("error", str(e))
+
+	proceed_button.config(state="disabled")
+	cancel_button.config(state="normal")
+	set_inputs_state("disabled")
+	progress_bar["value"] = 0
+	progress_label.config(text="Starting")
+	threading.stack_size(512*1024*1024) # Rivers calculation is deeply recursive
+	threading.Thread(target=convert, daemon=True).start()
+	root.after(100, poll_progress)
+
+def format_eta(eta):
+	if eta == None:
+		return ""
+	minutes, seconds = divmod(int(eta), 60)
+	return " (remaining: {:d}:{:02d})".format(minutes, seconds)
+
+def poll_progress():
+	global conversion
+	for event in conversion.get_events():
+		status = event[0]
+		if status == "progress":
+			_, stage, fraction, eta = event
+			progress_bar["value"] = fraction
+			progress_label.config(text="{:s}: {:d}%{:s}".format(stage, int(fraction*100), format_eta(eta)))
+		else:
+			if status == "done":
+				progress_bar["value"] = 1.
+				progress_label.config(text="Done.")
+			elif status == "cancelled":
+				progress_bar["value"] = 0
+				progress_label.config(text="Cancelled.")
+			else:
+				progress_label.config(text="Error: " + event[1])
+			conversion = None
+			proceed_button.config(state="normal")
+			cancel_button.config(state="disabled")
+			set_inputs_state("normal")
+			return
+	root.after(100, poll_progress)
+
+def cancel():
+	if conversion:
+		conversion.cancel()
+		progress_label.config(text="Cancelling...")
+
+proceed_button = tk.Button(root, text="Proceed", command=proceed)
 proceed_button.pack()
+cancel_button = tk.Button(frame_progress, text="Cancel", command=cancel, state="disabled")
+cancel_button.grid(row=0, column=1)
 
 tk.mainloop()
@@ -50,6 +50,13 @@ def update_map(mapname, newfilepath, get_proj=None):
 			proj.ImportFromEPSG(epsg)
 			dataset.SetProjection(proj.ExportToWkt())
 
+def transform_points(transform, x, y): # Transform arrays of coordinates in one call
+	shape = np.shape(x)
+	if np.size(x) == 0:
+		return np.zeros(shape), np.zeros(shape)
+	points = np.array(transform.TransformPoints(np.column_stack((np.ravel(x), np.ravel(y))).tolist()))
+	return points[:,0].reshape(shape), points[:,1].reshape(shape)
+
 def get_map_bounds(mapname):
 	if mapname in maps:
 		thismap = maps[mapname]
@@ -61,39 +68,47 @@ def get_map_bounds(mapname):
 	proj = osr.SpatialReference()
 	proj.ImportFromWkt(thismap.GetProjection())
 	transform = osr.CreateCoordinateTransformation(proj, wgs)
-	minp = gm.transform(gt, (0, 0))
-	maxp = gm.transform(gt, (xsize, ysize))
-	xmin, ymin, _ = transform.TransformPoint(minp[0], minp[1])
-	xmax, ymax, _ = transform.TransformPoint(maxp[0], maxp[1])
+	x, y = transform_points(transform, *gm.transform(gt, ([0, xsize], [0, ysize])))
+	xmin, xmax = x
+	ymin, ymax = y
 	north = max(ymin, ymax) # Maps might be reversed, so we're not sure which one is actually the maximum
 	east = max(xmin, xmax)
 	south = min(ymin, ymax)
 	west = min(xmin, xmax)
 	return (north, east, south, west)
 
-def get_map_size():
-	if param_reference in maps:
-		refmap = maps[param_reference]
+def get_map_size(reproject=None, crop=None, region=None, hscale=None, reference=None): # Parameters not given are taken from set_parameters
+	if reproject == None:
+		reproject = param_reproject
+	if crop == None:
+		crop = param_crop
+	if region == None:
+		region = param_region
+	if hscale == None:
+		hscale = param_hscale
+	if reference == None:
+		reference = param_reference
+
+	if reference in maps:
+		refmap = maps[reference]
 	else:
-		print("Map", param_reference, "does not exist.")
+		print("Map", reference, "does not exist.")
 		return
-	if param_crop:
-		if param_reproject:
-			north, east, south, west = param_region
-			minp = merc_transform.TransformPoint(west, south)
-			maxp = merc_transform.TransformPoint(east, north)
-			pxsize = param_hscale / np.cos(np.radians((north+south)/2))
-			npx = (maxp[0]-minp[0]) // pxsize
-			npy = (maxp[1]-minp[1]) // pxsize
+	if crop:
+		if reproject:
+			north, east, south, west = region
+			x, y = transform_points(merc_transform, [west, east], [south, north])
+			pxsize = hscale / np.cos(np.radians((north+south)/2))
+			npx = (x[1]-x[0]) // pxsize
+			npy = (y[1]-y[0]) // pxsize
 			return int(npx), int(npy), 0, 0, pxsize
 		else:
 			gt = refmap.GetGeoTransform()
 			proj = osr.SpatialReference()
 			proj.ImportFromWkt(refmap.GetProjection())
 			transform = osr.CreateCoordinateTransformation(wgs, proj)
-			north, east, south, west = param_region
-			xNW, yNW = gm.inverse(gt, transform.TransformPoint(west, north))
-			xSE, ySE = gm.inverse(gt, transform.TransformPoint(east, south))
+			north, east, south, west = region
+			(xNW, xSE), (yNW, ySE) = gm.inverse(gt, transform_points(transform, [west, east], [north, south]))
 			xmin = np.floor(min(xNW, xSE)+.5)
 			xmax = np.floor(max(xNW, xSE)+.5)
 			ymin = np.floor(min(yNW, ySE)+.5)
@@ -102,34 +117,76 @@ def get_map_size():
 	else:
 		return refmap.RasterXSize, refmap.RasterYSize, 0, 0, 0
 
-def read_map(mapname, interp=gdal.GRA_NearestNeighbour):
+def get_geotransform(): # Projection and geotransform of the output map, with the current parameters
 	npx, npy, xmin, ymin, pxsize = get_map_size()
-	if mapname in maps:
-		map1 = maps[mapname]
-	else:
-		print("Map", mapname, "does not exist.")
-		return
-
-	print("Reading", mapname)
 	if param_reproject:
-		proj = mercator
-		transform = merc_transform
 		north, east, south, west = param_region
 		origin = merc_transform.TransformPoint(west, north)
-		geotransform = (origin[0], pxsize, 0., origin[1], 0., -pxsize)
-	elif mapname == param_reference:
-		return map1.ReadAsArray(xmin, ymin, npx, npy)
+		return mercator, (origin[0], pxsize, 0., origin[1], 0., -pxsize)
 	else:
 		refmap = maps[param_reference]
 		proj = osr.SpatialReference()
 		proj.ImportFromWkt(refmap.GetProjection())
-		transform = osr.CreateCoordinateTransformation(wgs, proj)
 		ref_gt = refmap.GetGeoTransform()
 		origin = gm.transform(ref_gt, (xmin, ymin))
-		geotransform = (origin[0], ref_gt[1], ref_gt[2], origin[1], ref_gt[4], ref_gt[5])
-			
+		return proj, (origin[0], ref_gt[1], ref_gt[2], origin[1], ref_gt[4], ref_gt[5])
+
+def get_pixel_coords(lon, lat): # Position of real-world points (arrays of decimal degrees) in pixels of the output map
+	proj, geotransform = get_geotransform()
+	transform = osr.CreateCoordinateTransformation(wgs, proj)
+	return gm.inverse(geotransform, transform_points(transform, lon, lat))
+
+def get_preview_size(preview_size): # Size of a preview whose largest side is preview_size, keeping the footprint of the full map
+	npx, npy, _, _, _ = get_map_size()
+	factor = max(npx, npy) / preview_size
+	if factor <= 1:
+		return npx, npy
+	return max(int(round(npx / factor)), 1), max(int(round(npy / factor)), 1)
+
+def read_map(mapname, interp=gdal.GRA_NearestNeighbour, progress=None, preview=None):
+	npx, npy, xmin, ymin, pxsize = get_map_size()
+	if mapname in maps:
+		map1 = maps[mapname]
+	else:
+		print("Map", mapname, "does not exist.")
+		return
+
+	print("Reading", mapname)
+	if preview:
+		npx2, npy2 = get_preview_size(preview)
+		if interp in (gdal.GRA_Bilinear, gdal.GRA_Cubic, gdal.GRA_CubicSpline, gdal.GRA_Lanczos): # Their kernel widens with the downsampling factor
+			interp = gdal.GRA_NearestNeighbour # Keep others: max is needed for thin rivers to survive
+	if mapname == param_reference and not param_reproject:
+		if preview: # Decimated read, only needed source pixels (or overviews) are read
+			return map1.ReadAsArray(xmin, ymin, npx, npy, buf_xsize=npx2, buf_ysize=npy2)
+		return map1.ReadAsArray(xmin, ymin, npx, npy)
+	proj, geotransform = get_geotransform()
+
+	if preview: # Same footprint with larger pixels
+		fx, fy = npx / npx2, npy / npy2
+		a, b, c, d, e, f = geotransform
+		geotransform = (a, b*fx, c*fy, d, e*fx, f*fy)
+		npx, npy = npx2, npy2
+
 	map2 = drv.Create("", npx, npy, 1, map1.GetRasterBand(1).DataType)
 	map2.SetGeoTransform(geotransform)
-	print("Reprojecting", mapname)
-	gdal.ReprojectImage(map1, map2, map1.GetProjection(), proj.ExportToWkt(), interp)
+	map2.SetProjection(proj.ExportToWkt())
+	callback = None
+	errors = []
+	if progress:
+		def callback(complete, message, data): # GDAL progress callback: return 0 to stop reprojection
+			try:
+				progress("Reprojecting " + mapname, complete)
+				return 1
+			except Exception as e:
+				errors.append(e)
+				return 0
+	if preview:
+		print("Warping", mapname, "for preview")
+		gdal.Warp(map2, map1, resampleAlg=interp, callback=callback) # Unlike ReprojectImage, Warp reads from overviews when downsampling
+	else:
+		print("Reprojecting", mapname)
+		gdal.ReprojectImage(map1, map2, map1.GetProjection(), proj.ExportToWkt(), interp, callback=callback)
+	if errors:
+		raise errors[0]
 	return map2.ReadAsArray()
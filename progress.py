@@ -0,0 +1,45 @@
+import queue
+import threading
+import time
+
+class Cancelled(Exception):
+	pass
+
+class Progress: # Passed as 'progress' callback to the conversion functions, to report progress to another thread and allow cancellation
+	def __init__(self, interval=0.1):
+		self.events = queue.Queue()
+		self.cancel_event = threading.Event()
+		self.interval = interval # Minimal time between two events of the same stage
+		self.stage = None
+		self.stage_start = 0
+		self.start_fraction = 0
+		self.last_event = 0
+
+	def __call__(self, stage, fraction): # Called by the worker. Raises Cancelled if cancellation has been requested
+		if self.cancel_event.is_set():
+			raise Cancelled()
+		t = time.time()
+		if stage != self.stage:
+			self.stage = stage
+			self.stage_start = t
+			self.start_fraction = fraction # Stage may already be advanced when its first event arrives
+		elif t - self.last_event < self.interval and fraction < 1:
+			return
+		self.last_event = t
+		eta = None
+		if fraction > self.start_fraction:
+			eta = (t - self.stage_start) * (1 - fraction) / (fraction - self.start_fraction) # Remaining time for this stage
+		self.events.put(("progress", stage, fraction, eta))
+
+	def cancel(self):
+		self.cancel_event.set()
+
+	def finish(self, status, message=""): # status is "done", "cancelled" or "error"
+		self.events.put((status, message))
+
+	def get_events(self): # Called by the GUI thread, never blocks
+		while True:
+			try:
+				yield self.events.get_nowait()
+			except queue.Empty:
+				return
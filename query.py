@@ -0,0 +1,16 @@
+# Batch geographic queries: find where real-world points (POIs, spawn points, roads...) are in a generated Minetest world.
+# map_transform must have the same maps and parameters as when the database was generated.
+
+import map_transform
+import database
+
+def query(fpath_output, lon, lat):
+	fpath_conf = fpath_output + ".conf"
+	npx, npy, _, _, _ = map_transform.get_map_size()
+	px, py = map_transform.get_pixel_coords(lon, lat)
+	with open(fpath_output, "rb") as f:
+		reader = database.Reader(f)
+		# Database may be smaller than the map (preview)
+		xdb = px * (reader.X / npx)
+		ydb = py * (reader.Y / npy)
+		return reader.query(xdb, ydb, conf=database.read_conf(fpath_conf))
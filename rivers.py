@@ -3,7 +3,7 @@ import sys
 import numpy as np
 sys.setrecursionlimit(65536)
 
-def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdiff=40, river_power=0.25):
+def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdiff=40, river_power=0.25, progress=None):
 	print("Generating rivermap")
 	print("[rivers] Finding start points")
 
@@ -37,6 +37,7 @@ def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdif
 	find_start_points(seas)
 
 	to_explore = X * Y - np.count_nonzero(seas)
+	land_points = to_explore
 
 	for x in np.flatnonzero(~seas[0,:]):
 		add_start_point(0, x)
@@ -55,6 +56,8 @@ def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdif
 	heapify(heap)
 
 	print("[rivers] Building river trees:", str(to_explore), "points to visit")
+	if progress:
+		progress("Building river trees", 0)
 
 	flow_dirs = np.zeros((Y, X), dtype=np.int8)
 
@@ -90,6 +93,8 @@ def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdif
 		to_explore -= 1
 		if to_explore % 1000000 == 0:
 			print("[rivers]", str(to_explore // 1000000), "× 10⁶ points remaining", "Altitude:", int(t[0]), "Queue:", len(heap))
+		if progress and to_explore % 0x10000 == 0:
+			progress("Building river trees", 1 - to_explore / land_points)
 		process_neighbors(t[1], t[2])
 
 	visited = None
@@ -136,10 +141,16 @@ def generate_rivermap(heightmap, sea_level=128, river_limit=1000, max_river_hdif
 		return water
 
 	maxwater = 0
+	done = 0
+	if progress:
+		progress("Calculating water quantity", 0)
 	for start in start_points:
 		water = set_water(start[1], start[2])
 		if water > maxwater:
 			maxwater = water
+		if progress: # Every start point is the mouth of a river tree, so water quantity is the number of points processed
+			done += water
+			progress("Calculating water quantity", done / land_points)
 
 	print("[rivers] Maximal water quantity:", str(maxwater))
 